@@ -0,0 +1,14 @@
+'''
+Huffman compression
+'''
+
+
+def open(filename, mode='rb', **kwargs):
+    '''
+    Opens a huffman compressed file, see compression.huffmanfile.open
+
+    Imported on demand so that compression.client stays free of the
+    encoder's dependencies.
+    '''
+    from compression import huffmanfile
+    return huffmanfile.open(filename, mode, **kwargs)
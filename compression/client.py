@@ -0,0 +1,193 @@
+'''
+Thin client for the huffman compression server
+
+Only depends on the standard library so that invoking it doesn't pay for
+importing the encoder itself.
+'''
+import argparse
+import os.path
+import socket
+import sys
+from typing import BinaryIO
+
+DEFAULT_SOCKET = '/tmp/huffman.sock'
+
+# Request operations
+ENCODE = b'e'
+ENCODE_CANONICAL = b'c'
+DECODE = b'd'
+# Response statuses
+OK = b'ok'
+ERROR = b'err'
+
+
+class HuffmanServerException(Exception):
+    '''
+    Exception to be thrown when the server fails to handle a request
+    '''
+    def __init__(self, message):
+        self._message = message
+
+    def __str__(self):
+        return f'Huffman server failed to handle request. {self._message}.'
+
+
+def write_message(stream: BinaryIO, operation: bytes, payload: bytes) -> None:
+    '''
+    Writes a message to stream
+
+    A message is a line with the operation and the payload length in hex
+    separated by a comma, followed by the payload itself, e.g.
+    b'e,5\\nhello'
+    '''
+    stream.write(b'%s,%x\n' % (operation, len(payload)))
+    stream.write(payload)
+    stream.flush()
+
+
+def read_message(stream: BinaryIO) -> (bytes, bytes):
+    '''
+    Reads a message written by write_message from stream
+
+    Returns
+    -------
+        operation: bytes
+            The operation or status of the message
+        payload: bytes
+            The payload of the message
+    None is returned if the stream was closed before a message started.
+    '''
+    line = stream.readline()
+    if not line:
+        return None
+    operation, length = line.rstrip(b'\n').split(b',')
+    length = int(length, 16)
+    payload = stream.read(length)
+    if len(payload) != length:
+        raise EOFError('Stream closed in the middle of a message')
+    return operation, payload
+
+
+class HuffmanClient:
+    '''Client for the huffman compression server
+
+    Keeps one connection to the server open so several requests can be sent
+    without reconnecting. Can be used as a context manager.
+
+    Parameters
+    ---------
+    socket_path: str, optional
+        Path to the unix domain socket the server listens on
+    timeout: float, optional
+        Seconds to wait on the server before raising socket.timeout, waits
+        forever if not supplied
+    '''
+    def __init__(self, socket_path: str = DEFAULT_SOCKET,
+                 timeout: float = None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path)
+        self._stream = self._socket.makefile('rwb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        '''
+        Closes the connection to the server
+        '''
+        self._stream.close()
+        self._socket.close()
+
+    def encode(self, data: bytes, canonical=False) -> bytes:
+        '''
+        Encodes data on the server, see huffman.encode_data
+        '''
+        return self.request(ENCODE_CANONICAL if canonical else ENCODE, data)
+
+    def decode(self, compressed_data: bytes) -> bytes:
+        '''
+        Decodes compressed_data on the server, see huffman.decode_data
+        '''
+        return self.request(DECODE, compressed_data)
+
+    def request(self, operation: bytes, payload: bytes) -> bytes:
+        '''
+        Sends a request to the server and returns the response payload
+
+        Raises
+        -----
+        HuffmanServerException if the server responds with an error
+        '''
+        write_message(self._stream, operation, payload)
+        response = read_message(self._stream)
+        if response is None:
+            raise HuffmanServerException('Connection closed by server')
+        status, payload = response
+        if status != OK:
+            raise HuffmanServerException(payload.decode())
+        return payload
+
+
+def exit_with_message(message: str, exitcode: int = -1) -> None:
+    """
+    Print message to stdout before exit
+    """
+    print(message)
+    sys.exit(exitcode)
+
+
+def main() -> None:
+    '''
+    Main interactive function
+    '''
+    args = parse_args(sys.argv[1:])
+    if args.encode == args.decode:
+        exit_with_message('Exactly one of encode or decode must be supplied')
+    if not args.input or not os.path.isfile(args.input):
+        exit_with_message('Input file doesn\'t exist')
+    if not args.output or os.path.isdir(args.output):
+        exit_with_message('No valid output file is supplied')
+
+    with open(args.input, 'rb') as fin:
+        data = fin.read()
+    try:
+        with HuffmanClient(args.socket) as client:
+            result = (client.encode(data, args.canon) if args.encode
+                      else client.decode(data))
+    except (OSError, HuffmanServerException) as error:
+        exit_with_message(str(error))
+    with open(args.output, 'wb') as fout:
+        fout.write(result)
+
+
+def parse_args(args):
+    '''
+    Parses program argumens
+    '''
+    parser = argparse.ArgumentParser(
+            description='Huffman encode and decode files through a running'
+                        + ' compression server.')
+    parser.add_argument('--encode', '-e', action='store_true',
+                        help='Encodes a file')
+    parser.add_argument('--decode', '-d', action='store_true',
+                        help='Decodes a file')
+    parser.add_argument('--input', '-i', action='store',
+                        help='Path to the input file\
+                                where content should be read from')
+    parser.add_argument('--canon', '-c', action='store_true',
+                        help='Encode with canonical format')
+    parser.add_argument('--output', '-o', action='store',
+                        help='Path to the output file where\
+                                content should be written')
+    parser.add_argument('--socket', '-s', action='store',
+                        default=DEFAULT_SOCKET,
+                        help='Path to the unix domain socket of the server')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    main()
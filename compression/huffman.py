@@ -2,14 +2,38 @@
 Huffman compress/decompress
 '''
 import argparse
+import io
+import mmap
+import re
 import sys
 import os.path
+from array import array
+from itertools import islice
 from typing import BinaryIO
 from bitarray import bitarray, decodetree
 from bitarray.util import zeros
 from compression import huffmantree
 
 VERBOSE = False
+# Marks the trailing line of a block that was appended to an existing stream
+BLOCK_TRAILER = b'BLK'
+# Enough to hold the longest possible block trailer line
+TRAILER_MAX_LEN = 64
+# Symbols from RUN_SYMBOL + k repeat the previous byte 2**k more times
+RUN_SYMBOL = 0x100
+# Shortest run of a byte replaced by run symbols
+RUN_MIN_LEN = 8
+# Share of the symbols run length encoding has to save to be used
+RUN_MIN_SAVING = 0.5
+# Bytes of data sampled for runs before run length encoding it, spread over
+# RUN_SAMPLE_COUNT windows
+RUN_SAMPLE_SIZE = 1 << 16
+RUN_SAMPLE_COUNT = 16
+# Decoded bytes held at a time by decode_into before copying into the target
+DECODE_CHUNK_SIZE = 1 << 16
+RUN_PATTERN = re.compile(rb'(.)\1{%d,}' % (RUN_MIN_LEN - 1), re.DOTALL)
+# Consecutive run symbols in the high bytes of decoded symbols
+RUN_SYMBOLS_PATTERN = re.compile(rb'[^\x00]+')
 
 def encode_file(input_file: str, output_file: str, canonical=False) -> None:
     '''Attempts to open and read from the supplied input_file.
@@ -30,7 +54,8 @@ def encode_file(input_file: str, output_file: str, canonical=False) -> None:
         fout.write(compressed_data)
 
 
-def decode_file(input_file: str, output_file: str) -> None:
+def decode_file(input_file: str, output_file: str,
+                max_output: int = None) -> None:
     '''Attempts to open and read from the supplied input_file.
     If successful will try and construct a huffman tree from the header\
             contents in the
@@ -43,12 +68,73 @@ def decode_file(input_file: str, output_file: str) -> None:
 
     output_file: file, required
         The output file which where the decoded data should be written.
+
+    max_output: int, optional
+        Only decode the first max_output bytes. The input_file is memory\
+        mapped so only the parts needed for them are read.
     '''
     with open(input_file, 'rb') as fin, open(output_file, 'wb') as fout:
-        decompressed_data = decode_data(fin.read())
+        if os.fstat(fin.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            decompressed_data = decode_data(data, max_output)
         fout.write(decompressed_data)
 
 
+def append_file(input_file: str, output_file: str, canonical=False) -> None:
+    '''Attempts to open and read from the supplied input_file.
+    If successful will huffman encode the data as a new block and append it\
+    to the already compressed output_file without touching its existing\
+    content. If the output_file doesn't exist or is empty it is encoded\
+    as with encode_file.
+
+    Parameters
+    ---------
+    input_file: file, required
+        The file which content should be compressed and appended.
+
+    output_file: file, required
+        The compressed file which the encoded block should be appended to.
+    '''
+    if not os.path.isfile(output_file) or os.path.getsize(output_file) == 0:
+        encode_file(input_file, output_file, canonical)
+        return
+    with open(input_file, 'rb') as fin, open(output_file, 'r+b') as fout:
+        block = encode_block(fout, fin.read(), canonical)
+        fout.seek(0, os.SEEK_END)
+        fout.write(block)
+
+
+def append_data(compressed_data: bytes, data: bytes,
+                canonical=False) -> bytes:
+    '''
+    Encodes data as a block that can be appended to compressed_data
+
+    Only the trailer and the header of the last table in compressed_data are
+    read, so the cost depends on the size of data alone. The returned block
+    should be concatenated to the end of compressed_data, the result can then
+    be decoded with decode_data as one stream.
+
+    Parameters
+    ---------
+    compressed_data: bytes
+        Binary huffman encoded content which data should be appended to
+    data: bytes
+        Binary content to be encoded
+    canonical: bool
+        If we should encode canonical or not
+
+    Returns
+    -------
+    bytes:
+        The encoded block, or data encoded as a first block by encode_data
+        if compressed_data is empty
+    '''
+    if not compressed_data:
+        return encode_data(data, canonical)
+    return encode_block(io.BytesIO(compressed_data), data, canonical)
+
+
 def encode_data(data: bytes, canonical=False) -> bytes:
     '''
     Main function for compressing
@@ -59,34 +145,677 @@ def encode_data(data: bytes, canonical=False) -> bytes:
      which is followed by the binary data. The last line in the binary content
     is reserved for how much padding we need to remove when decompressing the 
     content again.
+    Data dominated by long runs of a byte is run length encoded first, see
+    run_length_encode.
+
+    Parameters
+    ---------
+    data: bytes
+        Binary content to be encoded
+    canonical: bool
+        If we should encode canonical or not
+    '''
+    symbols = run_length_encode(data)
+    huffman = huffmantree.HuffmanTree(print_tree=VERBOSE, data=symbols)
+    symbol_tree, header = build_table(huffman, canonical, len(data))
+    encoded_data = encode(symbol_tree, symbols)
+    return header + encoded_data
+
+
+def encode_into(data: bytes, target, canonical=False) -> int:
+    '''
+    Encodes data like encode_data but writes the result straight into target
+
+    The encoded bits are written from the bitarray buffer without first
+    being copied into an intermediate bytes object.
 
     Parameters
     ---------
     data: bytes
         Binary content to be encoded
+    target:
+        Either a file object (anything with a write method, e.g. mmap) which
+        the result is written to at its current position, or a writable
+        buffer such as a bytearray or memoryview which is filled from the
+        start
     canonical: bool
         If we should encode canonical or not
+
+    Returns
+    -------
+    int:
+        Number of bytes written to target
+
+    Raises
+    -----
+    ValueError if target is a buffer too small to hold the encoded data
+    '''
+    symbols = run_length_encode(data)
+    huffman = huffmantree.HuffmanTree(print_tree=VERBOSE, data=symbols)
+    symbol_tree, header = build_table(huffman, canonical, len(data))
+    bits = encode_bits(symbol_tree, symbols)
+    _, nbytes, _, unused = bits.buffer_info()[:4]
+    # Exported buffers may hold garbage in the padding bits
+    bits.fill()
+    padding = b'\n%d' % unused
+    size = len(header) + nbytes + len(padding)
+    if hasattr(target, 'write'):
+        target.write(header)
+        bits.tofile(target)
+        target.write(padding)
+        return size
+
+    buffer = memoryview(target).cast('B')
+    if len(buffer) < size:
+        raise ValueError(f'Buffer of {len(buffer)} bytes can\'t hold'
+                         + f' {size} bytes of encoded data')
+    data_start = len(header)
+    data_end = data_start + nbytes
+    buffer[:data_start] = header
+    buffer[data_start:data_end] = memoryview(bits)
+    buffer[data_end:size] = padding
+    return size
+
+
+def run_length_encode(data: bytes):
+    '''
+    Replaces long runs of a byte in data with run symbols
+
+    A run of n bytes is replaced by the byte followed by a run symbol
+    RUN_SYMBOL + k for each bit k set in n - 1, i.e. the run symbols
+    together repeat the byte n - 1 more times. The run symbols extend the
+    alphabet coded by the huffman tree, so a run costs a handful of codes
+    no matter its length. The data is only run length encoded when runs of
+    at least RUN_MIN_LEN bytes save RUN_MIN_SAVING of its symbols, decoding
+    run symbols being slower than decoding bytes. A sample of the data is
+    checked first so that data without enough runs is only scanned in part.
+
+    Returns
+    -------
+        data itself if it isn't run length encoded, otherwise a list of the
+        symbols
+    '''
+    if not data or sample_run_saving(data) < RUN_MIN_SAVING:
+        return data
+    symbols = []
+    position = 0
+    for run in RUN_PATTERN.finditer(data):
+        symbols.extend(data[position:run.start()])
+        symbols.append(data[run.start()])
+        repeat = run.end() - run.start() - 1
+        symbols.extend(RUN_SYMBOL + bit for bit in range(repeat.bit_length())
+                       if repeat >> bit & 1)
+        position = run.end()
+    symbols.extend(data[position:])
+    if len(symbols) > len(data) * (1 - RUN_MIN_SAVING):
+        return data
+    return symbols
+
+
+def sample_run_saving(data: bytes) -> float:
+    '''
+    Estimates the share of symbols run_length_encode saves on data from
+    RUN_SAMPLE_COUNT windows spread evenly over it, data no longer than
+    RUN_SAMPLE_SIZE is scanned whole.
+    '''
+    window = RUN_SAMPLE_SIZE // RUN_SAMPLE_COUNT
+    step = max(window, len(data) // RUN_SAMPLE_COUNT)
+    sampled = saved = 0
+    for offset in range(0, len(data), step):
+        sample = data[offset:offset + window]
+        sampled += len(sample)
+        for run in RUN_PATTERN.finditer(sample):
+            length = run.end() - run.start()
+            # The run becomes its byte plus a run symbol per bit of repeat
+            saved += length - 1 - bin(length - 1).count('1')
+    return saved / sampled
+
+
+def expand_runs(symbols, limit: int = None, chunk_size: int = None):
+    '''
+    Generator reversing run_length_encode on the decoded symbols
+
+    Symbols are decoded in batches, the literal bytes between the run
+    symbols of a batch are copied in bulk. Runs are expanded into the chunk
+    being filled, a run longer than what the chunk has room for carries
+    over to the next chunks.
+
+    Parameters
+    ---------
+    symbols:
+        Iterator of decoded symbols, ending with the symbols of the block
+    limit: int, optional
+        Stop once this many bytes have been produced
+    chunk_size: int, optional
+        Yield chunks of this many bytes, the last one may be shorter. All of
+        symbols is expanded into one chunk if not supplied
+    '''
+    limit = sys.maxsize if limit is None else limit
+    size = min(chunk_size or sys.maxsize, limit)
+    batch_size = min(chunk_size or DECODE_CHUNK_SIZE, limit)
+    # Position of the low byte of each symbol in the batch bytes
+    low = 0 if sys.byteorder == 'little' else 1
+    chunk = bytearray()
+    produced = 0
+    previous = b''
+    while produced + len(chunk) < limit:
+        # Every symbol decodes to at least one byte
+        batch = array('H', list(islice(
+            symbols, min(batch_size, limit - produced - len(chunk)))))
+        if not batch:
+            break
+        raw = batch.tobytes()
+        literals, high = raw[low::2], raw[1 - low::2]
+        position = 0
+        for run in RUN_SYMBOLS_PATTERN.finditer(high):
+            start, end = run.span()
+            if start > position:
+                chunk += literals[position:start]
+                previous = literals[start - 1:start]
+            position = end
+            # The low bytes of run symbols are the bits of the repeat
+            repeat = sum(map((1).__lshift__, literals[start:end]))
+            while len(chunk) + repeat >= size:
+                count = max(size - len(chunk), 0)
+                chunk += previous * count
+                repeat -= count
+                yield chunk[:min(size, limit - produced)]
+                del chunk[:size]
+                produced += size
+                if produced >= limit:
+                    return
+            chunk += previous * repeat
+        if position < len(batch):
+            chunk += literals[position:]
+            previous = literals[-1:]
+        while len(chunk) >= size:
+            yield chunk[:min(size, limit - produced)]
+            del chunk[:size]
+            produced += size
+            if produced >= limit:
+                return
+    # The last symbols may expand past the limit
+    del chunk[limit - produced:]
+    if chunk:
+        yield chunk
+
+
+def has_runs(symbol_tree: dict) -> bool:
+    '''
+    Checks if symbol_tree codes run symbols, i.e. if the decoded symbols
+    need to be expanded with expand_runs.
+    '''
+    return max(symbol_tree, default=0) >= RUN_SYMBOL
+
+
+def build_table(huffman: huffmantree.HuffmanTree, canonical: bool,
+                size: int = None) -> (dict, bytes):
+    '''
+    Gets the symbol tree from huffman and constructs the matching header,
+    both depending on canonical or not. size is the number of bytes the
+    block decodes to, which is stored in the header together with the
+    length of the encoded data and the number of symbols if supplied.
     '''
-    huffman = huffmantree.HuffmanTree(print_tree=VERBOSE, data=data)
-    # Get symbol tree depending on canonical or not
     symbol_tree = (huffman.get_canon_tree() if canonical
                    else huffman.get_symbol_tree_by_val())
-    # Construct header depending onn canonical or not
-    header = (construct_canonical_header(symbol_tree) if canonical
-              else construct_header(symbol_tree))
-    encoded_data = encode(symbol_tree, data)
-    return header + encoded_data
+    lengths = ()
+    if size is not None:
+        char_freq = symbol_freq(huffman)
+        lengths = (size, encoded_length(symbol_tree, char_freq),
+                   sum(char_freq.values()))
+    header = (construct_canonical_header(symbol_tree, *lengths) if canonical
+              else construct_header(symbol_tree, *lengths))
+    return symbol_tree, header
+
+
+def symbol_freq(huffman: huffmantree.HuffmanTree) -> dict:
+    '''
+    Returns the frequency of each symbol in the data huffman was built from
+    '''
+    return {node.get_symbol(): node.get_freq() for node in huffman.get_tree()}
 
 
-def decode_data(compressed_data: bytes) -> bytes:
+def encoded_length(symbol_tree: dict, char_freq: dict) -> int:
+    '''
+    Returns the number of bits symbol_tree encodes the symbols in char_freq
+    into
+    '''
+    return sum(len(symbol_tree[symbol]) * freq
+               for symbol, freq in char_freq.items())
+
+
+def encode_block(stream: BinaryIO, data: bytes, canonical=False) -> bytes:
+    '''
+    Encodes data as a block to be appended at the end of stream
+
+    The table of the last block in stream is reused if it covers every
+    symbol in data and doesn't encode it worse than a fresh table together
+    with its header would. A reused table is signalled by an empty header.
+    The block ends with a trailer line containing the offset where the block
+    starts and the offset of the block holding its table.
+
+    Parameters
+    ---------
+    stream: BinaryIO
+        Seekable stream containing the compressed data to append to
+    data: bytes
+        Binary content to be encoded
+    canonical: bool
+        If we should encode canonical or not
+    '''
+    if not data:
+        return b''
+    offset = stream.seek(0, os.SEEK_END)
+    _, table_start = last_block_offsets(stream, offset)
+    stream.seek(table_start)
+    previous_tree = parse_header(read_table(stream)[0])
+    block, _, _ = build_block(data, offset, previous_tree, table_start,
+                              canonical)
+    return block
+
+
+def build_block(data: bytes, offset: int, previous_tree: dict,
+                table_start: int, canonical=False) -> (bytes, dict, int):
+    '''
+    Encodes data as a block starting at offset, see encode_block
+
+    Parameters
+    ---------
+    data: bytes
+        Binary content to be encoded, must not be empty
+    offset: int
+        Offset in the stream where the block will be written, a block at
+        offset 0 is encoded as by encode_data
+    previous_tree: dict
+        Symbol tree of the table in effect at the end of the stream
+    table_start: int
+        Offset of the block holding previous_tree
+    canonical: bool
+        If we should encode canonical or not
+
+    Returns
+    -------
+        block: bytes
+            The encoded block
+        symbol_tree: dict
+            The symbol tree in effect after the block
+        table_start: int
+            Offset of the block holding symbol_tree
+    '''
+    symbols = run_length_encode(data)
+    huffman = huffmantree.HuffmanTree(print_tree=VERBOSE, data=symbols)
+    symbol_tree, header = build_table(huffman, canonical, len(data))
+    if offset == 0:
+        return header + encode(symbol_tree, symbols), symbol_tree, 0
+    char_freq = symbol_freq(huffman)
+    if fits_table(previous_tree, symbol_tree, char_freq, len(header)):
+        symbol_tree = previous_tree
+        header = header_end(len(data), encoded_length(symbol_tree, char_freq),
+                            sum(char_freq.values()))
+    else:
+        table_start = offset
+    trailer = b'\n%s,%x,%x' % (BLOCK_TRAILER, offset, table_start)
+    return (header + encode(symbol_tree, symbols) + trailer, symbol_tree,
+            table_start)
+
+
+def fits_table(previous_tree: dict, symbol_tree: dict, char_freq: dict,
+               header_len: int) -> bool:
+    '''
+    Checks if previous_tree can encode the symbols in char_freq in no
+    more bits than symbol_tree plus a header of header_len bytes.
+    '''
+    if not previous_tree or not char_freq.keys() <= previous_tree.keys():
+        return False
+    return (encoded_length(previous_tree, char_freq)
+            <= encoded_length(symbol_tree, char_freq) + header_len * 8)
+
+
+def last_block_offsets(stream: BinaryIO, end: int) -> (int, int):
+    '''
+    Reads the trailer of the block ending at end in stream
+
+    Returns
+    -------
+        start: int
+            Offset where the block starts
+        table_start: int
+            Offset of the block whose header holds the table of the block
+    A block without trailer is the first block of the stream, in which case
+    both offsets are 0.
+    '''
+    tail_start = max(0, end - TRAILER_MAX_LEN)
+    stream.seek(tail_start)
+    tail = stream.read(end - tail_start)
+    return parse_trailer(tail[tail.rfind(b'\n') + 1:])
+
+
+def parse_trailer(last_line: bytes) -> (int, int):
+    '''
+    Parses the last line of a block, see last_block_offsets for the
+    returned offsets.
+    '''
+    if not last_line.startswith(BLOCK_TRAILER + b','):
+        return 0, 0
+    _, start, table_start = last_line.split(b',')
+    return int(start, 16), int(table_start, 16)
+
+
+def split_blocks(compressed_data: bytes) -> list:
+    '''
+    Splits compressed_data into the blocks it's made of
+
+    Walks the block trailers backwards from the end of compressed_data,
+    which can be any bytes-like object supporting rfind such as an mmap.
+
+    Returns
+    -------
+    list:
+        (start, end) offsets of each block in stream order, excluding
+        the trailers
+    '''
+    blocks = []
+    end = len(compressed_data)
+    while end > 0:
+        trailer_start = compressed_data.rfind(b'\n', 0, end)
+        start, _ = parse_trailer(bytes(compressed_data[trailer_start + 1:end]))
+        if start == 0:
+            blocks.append((0, end))
+            break
+        # The block ends where its trailer line begins
+        blocks.append((start, trailer_start))
+        end = start
+    return blocks[::-1]
+
+
+def decode_data(compressed_data: bytes, max_output: int = None) -> bytes:
     '''
     Main function for decompressing
 
     This function tries to decode the input data first as a 'normal'
     huffman encoding and if that doesn't work it will try to decode it
     as an canonical huffman encoding. If that fails we are all doomed.
+    Streams made of several appended blocks are decoded block by block,
+    blocks with an empty header are decoded with the previous table.
+
+    Parameters
+    ---------
+    compressed_data: bytes
+        Binary huffman encoded content, any bytes-like object supporting
+        find and rfind such as an mmap
+    max_output: int, optional
+        Stop decoding once this many bytes have been produced
+    '''
+    return bytearray().join(decode_blocks(compressed_data,
+                                          max_output=max_output))
+
+
+def decode_blocks(compressed_data: bytes, tables: dict = None,
+                  max_output: int = None, chunk_size: int = None):
+    '''
+    Generator decoding compressed_data one block at a time
+
+    The encoded data of blocks with a stored size is decoded in place from
+    compressed_data, without splitting it into lines or copying it into a
+    new bitarray. Decoding stops after the stored size, so the padding is
+    never reached, or after max_output bytes in total. Blocks are found
+    going forward from the encoded length stored next to the size, so
+    nothing after the data needed for max_output is read. Blocks without
+    stored lengths are found from the trailers at the end of
+    compressed_data instead and have their padding removed first, which
+    requires reading all of them.
+
+    Parameters
+    ---------
+    compressed_data: bytes
+        See decode_data
+    tables: dict, optional
+        See decode_into
+    max_output: int, optional
+        See decode_data
+    chunk_size: int, optional
+        Split the decoded data of each block into chunks of at most this
+        many bytes, decoding each chunk only when asked for
+
+    Yields
+    ------
+    bytes:
+        The decoded data of each block, or chunks of it
+
+    Raises
+    -----
+    ValueError if a block isn't followed by the expected padding or trailer
+    '''
+    encoded_view = memoryview(compressed_data).cast('B')
+    tables = {} if tables is None else tables
+    remaining = max_output
+    decoder = None
+    start = table_start = 0
+    while start < len(compressed_data):
+        if remaining is not None and remaining <= 0:
+            return
+        table, size, data_start, bits, symbol_count = read_block_table(
+            compressed_data, start, len(compressed_data))
+        if table:
+            decoder = get_decoder(tables, table)
+            table_start = start
+        if bits is None:
+            break
+        decode_tree, runs = decoder
+        limit = size if remaining is None else min(size, remaining)
+        data_end = data_start + (bits + 7) // 8
+        encoded_data = bitarray(buffer=encoded_view[data_start:data_end])
+        # The padding bits must not be decoded as symbols
+        symbols = islice(encoded_data.decode(decode_tree), symbol_count)
+        for decoded_data in decode_chunks(symbols, runs, limit, chunk_size):
+            if remaining is not None:
+                remaining -= len(decoded_data)
+            yield decoded_data
+        start = next_block_start(compressed_data, start, table_start,
+                                 data_start, bits)
+    if start >= len(compressed_data):
+        return
+
+    for block_start, end in split_blocks(compressed_data):
+        if block_start < start:
+            continue
+        if remaining is not None and remaining <= 0:
+            return
+        table, _, _, _, _ = read_block_table(compressed_data, block_start,
+                                             end)
+        if table:
+            decoder = get_decoder(tables, table)
+        _, encoded_data = deconstruct_encoded_data(
+            bytes(encoded_view[block_start:end]))
+        decode_tree, runs = decoder
+        for decoded_data in decode_chunks(encoded_data.decode(decode_tree),
+                                          runs, remaining, chunk_size):
+            if remaining is not None:
+                remaining -= len(decoded_data)
+            yield decoded_data
+
+
+def get_decoder(tables: dict, table: bytes) -> tuple:
+    '''
+    Returns the decoder of the raw header lines in table, from tables if
+    cached there
+
+    Returns
+    -------
+        decode_tree: decodetree
+            The bitarray decode tree of the table
+        runs: bool
+            If the table codes run symbols, see has_runs
+    '''
+    decoder = tables.get(table)
+    if decoder is None:
+        header, _ = read_table(io.BytesIO(table))
+        symbol_tree = parse_header(header)
+        decoder = tables[table] = (decodetree(symbol_tree),
+                                   has_runs(symbol_tree))
+    return decoder
+
+
+def next_block_start(compressed_data: bytes, start: int, table_start: int,
+                     data_start: int, bits: int) -> int:
+    '''
+    Returns the offset following the block starting at start, whose encoded
+    data starting at data_start is bits long and whose table is held by the
+    block at table_start.
+
+    Raises
+    -----
+    ValueError if the padding line or the trailer of the block don't match
+    '''
+    position = data_start + (bits + 7) // 8
+    padding = b'\n%d' % (-bits % 8)
+    if compressed_data[position:position + len(padding)] != padding:
+        raise ValueError(f'Invalid padding of block at offset {start}')
+    position += len(padding)
+    # Only blocks appended after the first one end with a trailer
+    if start > 0:
+        trailer = b'\n%s,%x,%x' % (BLOCK_TRAILER, start, table_start)
+        if compressed_data[position:position + len(trailer)] != trailer:
+            raise ValueError(f'Invalid trailer of block at offset {start}')
+        position += len(trailer)
+    return position
+
+
+def decode_chunks(symbols, runs: bool, limit: int = None,
+                  chunk_size: int = None):
+    '''
+    Generator turning decoded symbols into chunks of bytes
+
+    Parameters
+    ---------
+    symbols:
+        Iterator of decoded symbols, ending with the symbols of the block
+        when runs is set
+    runs: bool
+        If the symbols are run length encoded, see run_length_encode
+    limit: int, optional
+        Stop once this many bytes have been produced
+    chunk_size: int, optional
+        See decode_blocks, all of symbols is decoded at once if not supplied
+    '''
+    if runs:
+        yield from expand_runs(symbols, limit, chunk_size)
+        return
+    while limit is None or limit > 0:
+        count = limit if chunk_size is None else min(chunk_size,
+                                                      limit or chunk_size)
+        decoded_data = bytes(islice(symbols, count))
+        if not decoded_data:
+            return
+        if limit is not None:
+            limit -= len(decoded_data)
+        yield decoded_data
+        if count is None:
+            return
+
+
+def decode_into(compressed_data: bytes, target, tables: dict = None) -> int:
+    '''
+    Decodes compressed_data like decode_data but writes the result straight
+    into target
+
+    Blocks are decoded by decode_blocks in chunks of DECODE_CHUNK_SIZE
+    bytes, each written to target with a single slice assignment, so the
+    intermediate bytes don't grow with the block size.
+
+    Parameters
+    ---------
+    compressed_data: bytes
+        Binary huffman encoded content, any bytes-like object supporting
+        find and rfind such as an mmap
+    target:
+        Writable buffer such as a bytearray, memoryview or mmap of at least
+        decoded_size(compressed_data) bytes which is filled from the start
+    tables: dict, optional
+        Cache of decode trees, together with if they code run symbols, keyed
+        by the raw header lines of a block. Pass the same mapping between
+        calls to skip parsing headers already seen
+
+    Returns
+    -------
+    int:
+        Number of bytes written to target
+
+    Raises
+    -----
+    ValueError if target is too small to hold the decoded data
+    '''
+    buffer = memoryview(target).cast('B')
+    position = 0
+    for decoded_data in decode_blocks(compressed_data, tables,
+                                      chunk_size=DECODE_CHUNK_SIZE):
+        if position + len(decoded_data) > len(buffer):
+            raise ValueError(f'Buffer of {len(buffer)} bytes can\'t hold'
+                             + ' the decoded data')
+        buffer[position:position + len(decoded_data)] = decoded_data
+        position += len(decoded_data)
+    return position
+
+
+def decoded_size(compressed_data: bytes) -> int:
+    '''
+    Returns the number of bytes compressed_data decodes to
+
+    The size is read from the headers of the blocks, if any block lacks a
+    stored size the whole of compressed_data is decoded to find it.
+    '''
+    size = stored_size(compressed_data)
+    if size is None:
+        return len(decode_data(compressed_data))
+    return size
+
+
+def stored_size(compressed_data: bytes) -> int:
+    '''
+    Returns the sum of the decoded sizes stored in the headers of the blocks
+    of compressed_data, or None if any block lacks a stored size.
+    '''
+    total = 0
+    for start, end in split_blocks(compressed_data):
+        _, size, _, _, _ = read_block_table(compressed_data, start, end)
+        if size is None:
+            return None
+        total += size
+    return total
+
+
+def read_block_table(compressed_data: bytes, start: int,
+                     end: int) -> (bytes, int, int, int, int):
+    '''
+    Reads the header of the block between start and end in compressed_data
+
+    Returns
+    -------
+        table: bytes
+            The header lines preceding HEND, empty if the block reuses the
+            table of the previous block
+        size: int
+            The decoded size of the block or None if not stored
+        data_start: int
+            Offset where the encoded data of the block starts
+        bits: int
+            The length of the encoded data in bits or None if not stored
+        symbol_count: int
+            The number of symbols in the encoded data or None if not stored
+    '''
+    header_start = compressed_data.find(b'HEND', start, end)
+    data_start = compressed_data.find(b'\n', header_start, end) + 1
+    size, bits, symbol_count = read_header_end(
+        bytes(compressed_data[header_start:data_start - 1]))
+    return (bytes(compressed_data[start:header_start]), size, data_start, bits,
+            symbol_count)
+
+
+def parse_header(header: dict) -> dict:
+    '''
+    Constructs the symbol tree from a deserialized header, either as a
+    'normal' or as a canonical huffman header.
     '''
-    header, encoded_data = deconstruct_encoded_data(compressed_data)
     symbol_tree = {}
     try:
         # Regular huffman
@@ -101,16 +830,24 @@ def decode_data(compressed_data: bytes) -> bytes:
         except ValueError as error:
             exit_with_message('Could not intepret header as canonical'
                               + f' {repr(error)}')
-    return decode(symbol_tree, encoded_data)
+    return symbol_tree
 
 
-def construct_header(symbol_tree: dict) -> bytes:
+def construct_header(symbol_tree: dict, size: int = None, bits: int = None,
+                     symbol_count: int = None) -> bytes:
     '''Builds the header from left to right based on the tree 
 
     Parameters
     ---------
     symbol_tree: dict
         Contains the dict over the respective symbols and their huffman codes
+    size: int, optional
+        Number of bytes the block decodes to, stored on the last line
+    bits: int, optional
+        Length of the encoded data in bits, stored after size
+    symbol_count: int, optional
+        Number of symbols in the encoded data, stored after bits when it
+        differs from size
 
     Returns
     ------
@@ -121,6 +858,8 @@ def construct_header(symbol_tree: dict) -> bytes:
         Thus the output will be something like this:
         b'00,a\n001,s\n-1\n01s\nn101\n'
         The negative integer represents switch from left to right.
+        The header ends with HEND, followed by the size, the encoded
+        length and the number of symbols in hex if supplied.
     '''
     symbols = b''
     left_tree_visited = False
@@ -132,7 +871,37 @@ def construct_header(symbol_tree: dict) -> bytes:
         symbols += b'%x,%s\n' % (symbol, code.to01()[1:].encode())
 
     # Need an indicator to know where header ends
-    return symbols + b'HEND\n'
+    return symbols + header_end(size, bits, symbol_count)
+
+
+def header_end(size: int = None, bits: int = None,
+               symbol_count: int = None) -> bytes:
+    '''
+    Returns the line ending a header, with the decoded size of the block,
+    the length of its encoded data in bits and its number of symbols if
+    supplied. The number of symbols is only stored if it differs from the
+    size, i.e. for run length encoded blocks.
+    '''
+    if size is None:
+        return b'HEND\n'
+    if bits is None:
+        return b'HEND,%x\n' % size
+    if symbol_count is None or symbol_count == size:
+        return b'HEND,%x,%x\n' % (size, bits)
+    return b'HEND,%x,%x,%x\n' % (size, bits, symbol_count)
+
+
+def read_header_end(line: bytes) -> (int, int, int):
+    '''
+    Returns the decoded size, the encoded length and the number of symbols
+    stored on the HEND line of a header, each None if the line doesn't hold
+    it. The number of symbols is the size if only the lengths are stored.
+    '''
+    lengths = [int(length, 16) for length in line.split(b',')[1:]]
+    if len(lengths) == 2:
+        lengths.append(lengths[0])
+    lengths += [None] * (3 - len(lengths))
+    return tuple(lengths)
 
 
 def encode(symbol_tree: dict, text: bytes) -> bytes:
@@ -153,9 +922,7 @@ def encode(symbol_tree: dict, text: bytes) -> bytes:
         encoded data followed by newline and unused bytes i.e.
         how much padding we need to remove when decoding
     '''
-    encode = bitarray()
-    # Encode data
-    encode.encode(symbol_tree, text)
+    encode = encode_bits(symbol_tree, text)
     # Get extra bytes padding of encoding
     unused = encode.buffer_info()[3]
     unused_buffer = b'%d' % unused
@@ -163,6 +930,15 @@ def encode(symbol_tree: dict, text: bytes) -> bytes:
     return encode.tobytes() + b'\n' + unused_buffer
 
 
+def encode_bits(symbol_tree: dict, text: bytes) -> bitarray:
+    '''
+    Encodes text into a bitarray based on the huffman tree in symbol_tree
+    '''
+    encode = bitarray()
+    encode.encode(symbol_tree, text)
+    return encode
+
+
 def deconstruct_encoded_data(compressed_data: bytes) -> (dict, bitarray):
     '''
     Splits the encoded data into their respective parts
@@ -187,7 +963,7 @@ def deconstruct_encoded_data(compressed_data: bytes) -> (dict, bitarray):
     header = {}
     data_start = -1
     for index, line in enumerate(split_data):
-        if line == b'HEND':
+        if line.startswith(b'HEND'):
             data_start = index + 1
             break
         keyval = line.decode().split(',')
@@ -203,6 +979,28 @@ def deconstruct_encoded_data(compressed_data: bytes) -> (dict, bitarray):
     return header, bitdata
 
 
+def read_table(stream: BinaryIO) -> (dict, int):
+    '''
+    Reads the header lines of the block starting at the current position
+    of stream without reading the data following it.
+
+    Returns
+    -------
+        header: dict
+            The header in the same format as from deconstruct_encoded_data
+        size: int
+            The decoded size of the block or None if not stored
+    '''
+    header = {}
+    for line in stream:
+        line = line.rstrip(b'\n')
+        if line.startswith(b'HEND'):
+            return header, read_header_end(line)[0]
+        keyval = line.decode().split(',')
+        header[keyval[0]] = keyval[1]
+    return header, None
+
+
 def read_header(header: dict) -> dict:
     '''Constructs a huffman dictionary from the header {symbol, bitarray}'''
     symbol_tree = {}
@@ -223,17 +1021,22 @@ def read_header(header: dict) -> dict:
 def decode(symbol_tree: dict, encoded_data: bitarray) -> bytes:
     '''Decompresses bytes in data into it's original format'''
     decode_tree = decodetree(symbol_tree)
+    if has_runs(symbol_tree):
+        return bytearray().join(expand_runs(encoded_data.decode(decode_tree)))
     return bytearray(encoded_data.decode(decode_tree))
 
 
-def construct_canonical_header(symbol_tree: dict) -> bytes:
+def construct_canonical_header(symbol_tree: dict, size: int = None,
+                               bits: int = None,
+                               symbol_count: int = None) -> bytes:
     '''
-    Constructs a canonical huffman tree header from the supplied symbol_tree
+    Constructs a canonical huffman tree header from the supplied symbol_tree,
+    see construct_header for size, bits and symbol_count
     '''
     symbols = b''
     for symbol, code in symbol_tree.items():
         symbols += b'%x,%d\n' % (symbol, len(code))
-    return symbols + b'HEND\n'
+    return symbols + header_end(size, bits, symbol_count)
 
 
 def read_canonical_header(header: dict) -> dict:
@@ -286,6 +1089,15 @@ def check_input(args) -> None:
         exit_with_message('Can\'t compress and decompress files at the same'
                           + ' time')
 
+    if args.append and not args.encode:
+        exit_with_message('Append can only be used when encoding')
+
+    if args.head is not None and not args.decode:
+        exit_with_message('Head can only be used when decoding')
+
+    if args.head is not None and args.head < 0:
+        exit_with_message('Head can\'t be negative')
+
     if not args.input:
         exit_with_message('No input file is supplied')
 
@@ -319,7 +1131,12 @@ def main() -> None:
     args = parse_args(sys.argv[1:])
     check_input(args)
     VERBOSE = args.verbose
-    if args.encode:
+    if args.encode and args.append:
+        if VERBOSE:
+            print(f'Encoding {args.input} and appending data to'
+                  + f' {args.output}')
+        append_file(args.input, args.output, args.canon)
+    elif args.encode:
         if VERBOSE:
             print(f'Encoding {args.input} and writing data to'
                   + f' {args.output}')
@@ -329,7 +1146,7 @@ def main() -> None:
         if VERBOSE:
             print(f'Decoding {args.input} and writing data to'
                   + f' {args.output}')
-        decode_file(args.input, args.output)
+        decode_file(args.input, args.output, args.head)
 
 
 def parse_args(args):
@@ -350,6 +1167,11 @@ def parse_args(args):
     parser.add_argument('--output', '-o', action='store',
                         help='Path to the output file where\
                                 content should be written')
+    parser.add_argument('--append', '-a', action='store_true',
+                        help='Appends the encoded input to an already\
+                                encoded output file')
+    parser.add_argument('--head', '-n', action='store', type=int,
+                        help='Only decode the first HEAD bytes')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Verbose output')
     return parser.parse_args(args)
@@ -0,0 +1,306 @@
+'''
+File object reading and writing huffman compressed files
+'''
+import builtins
+import io
+import mmap
+import os
+import stat
+from compression import huffman
+
+# Uncompressed bytes encoded in each block written
+BLOCK_SIZE = 1 << 20
+# Uncompressed bytes decoded at a time when reading
+READ_CHUNK_SIZE = 1 << 16
+
+
+class DecodeReader(io.RawIOBase):
+    '''Raw reader decoding a compressed stream chunk by chunk
+
+    Parameters
+    ---------
+    compressed_data: bytes
+        Binary huffman encoded content, e.g. an mmap of the file
+    '''
+    def __init__(self, compressed_data: bytes):
+        self._chunks = huffman.decode_blocks(compressed_data,
+                                             chunk_size=READ_CHUNK_SIZE)
+        self._chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        size = min(len(b), len(self._chunk))
+        memoryview(b).cast('B')[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def close(self):
+        # Releases the views the generator holds on the compressed data
+        self._chunks.close()
+        self._chunk = memoryview(b'')
+        super().close()
+
+
+class HuffmanFile(io.BufferedIOBase):
+    '''File object reading or writing a huffman compressed file
+
+    Reading decodes lazily as data is consumed, writing buffers data and
+    appends it as a new block each time block_size bytes are pending, see
+    huffman.append_data. Memory use is bounded by the block size no matter
+    the size of the file. Files without a decoded size stored in their
+    headers are decoded one whole block at a time. Reading requires a
+    regular file, which is memory mapped.
+
+    Parameters
+    ---------
+    filename: str, optional
+        Path of the file to open
+    mode: str, optional
+        'rb' to read, 'wb' to write or 'ab' to append to an existing
+        compressed file
+    fileobj: file object, optional
+        Binary file object used instead of opening filename. Reading
+        requires it to be a regular file with a file descriptor, appending
+        requires it to be readable and seekable to find the last table
+
+    Raises
+    -----
+    io.UnsupportedOperation when reading anything else than a regular file,
+    e.g. a pipe, a socket or an io.BytesIO
+    canonical: bool, optional
+        If written blocks should be encoded canonical or not
+    block_size: int, optional
+        Number of uncompressed bytes encoded in each written block
+    '''
+    def __init__(self, filename: str = None, mode: str = 'rb',
+                 fileobj=None, canonical=False, block_size: int = BLOCK_SIZE):
+        self._fileobj = None
+        if mode not in ('r', 'rb', 'w', 'wb', 'a', 'ab'):
+            raise ValueError(f'Invalid mode: {mode!r}')
+        if filename is None and fileobj is None:
+            raise ValueError('Either filename or fileobj must be supplied')
+        self._mode = mode[0]
+        self._owns_file = fileobj is None
+        if fileobj is None:
+            fileobj = builtins.open(filename, {'r': 'rb', 'w': 'wb',
+                                               'a': 'a+b'}[self._mode])
+        self._fileobj = fileobj
+        self._position = 0
+        if self._mode == 'r':
+            try:
+                self._mapped = self.map_file(fileobj)
+            except io.UnsupportedOperation:
+                self._fileobj = None
+                if self._owns_file:
+                    fileobj.close()
+                raise
+            self._reader = io.BufferedReader(DecodeReader(self._mapped))
+        else:
+            self._canonical = canonical
+            self._block_size = block_size
+            self._pending = bytearray()
+            self._symbol_tree = {}
+            self._table_start = 0
+            self._offset = 0
+            if self._mode == 'a':
+                self.init_append()
+
+    @staticmethod
+    def map_file(fileobj):
+        '''
+        Memory maps fileobj so the compressed data is only read as far as
+        it's decoded, an empty file gives empty bytes
+
+        Raises
+        -----
+        io.UnsupportedOperation if fileobj isn't a regular file that can be
+        memory mapped, other input would have to be read into memory whole
+        '''
+        try:
+            file_stat = os.fstat(fileobj.fileno())
+        except (AttributeError, OSError) as error:
+            raise io.UnsupportedOperation(
+                'Only regular files can be read') from error
+        if not stat.S_ISREG(file_stat.st_mode):
+            raise io.UnsupportedOperation('Only regular files can be read')
+        if file_stat.st_size == 0:
+            return b''
+        try:
+            return mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as error:
+            raise io.UnsupportedOperation(
+                'File can\'t be memory mapped') from error
+
+    def init_append(self) -> None:
+        '''
+        Reads the table in effect at the end of the file being appended to
+        '''
+        self._offset = self._fileobj.seek(0, os.SEEK_END)
+        if self._offset == 0:
+            return
+        _, self._table_start = huffman.last_block_offsets(self._fileobj,
+                                                          self._offset)
+        self._fileobj.seek(self._table_start)
+        self._symbol_tree = huffman.parse_header(
+            huffman.read_table(self._fileobj)[0])
+        self._fileobj.seek(0, os.SEEK_END)
+
+    def check_mode(self, mode: str) -> None:
+        '''
+        Raises io.UnsupportedOperation unless opened in mode
+        '''
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        if self._mode != mode and not (mode == 'w' and self._mode == 'a'):
+            raise io.UnsupportedOperation(
+                'File not open for ' + ('reading' if mode == 'r'
+                                        else 'writing'))
+
+    @property
+    def closed(self):
+        return self._fileobj is None
+
+    def readable(self):
+        return not self.closed and self._mode == 'r'
+
+    def writable(self):
+        return not self.closed and self._mode != 'r'
+
+    def seekable(self):
+        return False
+
+    def fileno(self):
+        return self._fileobj.fileno()
+
+    def tell(self) -> int:
+        '''
+        Returns the position in the uncompressed data
+        '''
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        self.check_mode('r')
+        data = self._reader.read(size)
+        self._position += len(data)
+        return data
+
+    def read1(self, size: int = -1) -> bytes:
+        self.check_mode('r')
+        data = self._reader.read1(size)
+        self._position += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        self.check_mode('r')
+        size = self._reader.readinto(b)
+        self._position += size
+        return size
+
+    def peek(self, size: int = 0) -> bytes:
+        self.check_mode('r')
+        return self._reader.peek(size)
+
+    def readline(self, size: int = -1) -> bytes:
+        self.check_mode('r')
+        line = self._reader.readline(size)
+        self._position += len(line)
+        return line
+
+    def write(self, data) -> int:
+        self.check_mode('w')
+        with memoryview(data) as view:
+            size = view.nbytes
+            self._pending += view.cast('B')
+        self._position += size
+        while len(self._pending) >= self._block_size:
+            block = bytes(self._pending[:self._block_size])
+            del self._pending[:self._block_size]
+            self.write_block(block)
+        return size
+
+    def write_block(self, data: bytes) -> None:
+        '''
+        Encodes data as a new block at the end of the file
+        '''
+        block, self._symbol_tree, self._table_start = huffman.build_block(
+            data, self._offset, self._symbol_tree, self._table_start,
+            self._canonical)
+        self._fileobj.write(block)
+        self._offset += len(block)
+
+    def flush(self) -> None:
+        '''
+        Writes any pending data as a block, which might make the file
+        compress worse if done often
+        '''
+        self.check_mode(self._mode)
+        if self._mode != 'r':
+            if self._pending:
+                self.write_block(bytes(self._pending))
+                self._pending.clear()
+            self._fileobj.flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._mode == 'r':
+                self._reader.close()
+                if isinstance(self._mapped, mmap.mmap):
+                    self._mapped.close()
+            else:
+                self.flush()
+        finally:
+            fileobj, self._fileobj = self._fileobj, None
+            if self._owns_file:
+                fileobj.close()
+
+
+def open(filename: str, mode: str = 'rb', canonical=False,
+         block_size: int = BLOCK_SIZE, encoding: str = None,
+         errors: str = None, newline: str = None):
+    '''
+    Opens a huffman compressed file in binary or text mode, like gzip.open
+
+    Parameters
+    ---------
+    filename: str
+        Path of the file or a binary file object, which has to be a regular
+        file when reading
+    mode: str, optional
+        One of 'r', 'w' or 'a', optionally followed by 'b' for binary (the
+        default) or 't' for text mode
+    canonical, block_size:
+        See HuffmanFile
+    encoding, errors, newline:
+        See io.TextIOWrapper, only allowed in text mode
+
+    Returns
+    -------
+        A HuffmanFile, wrapped in an io.TextIOWrapper in text mode
+    '''
+    if 't' in mode:
+        if 'b' in mode:
+            raise ValueError(f'Invalid mode: {mode!r}')
+    elif encoding is not None or errors is not None or newline is not None:
+        raise ValueError('Encoding, errors and newline are only allowed in'
+                         + ' text mode')
+    binary_mode = mode.replace('t', '')
+    if isinstance(filename, (str, bytes, os.PathLike)):
+        binary_file = HuffmanFile(filename, binary_mode, canonical=canonical,
+                                  block_size=block_size)
+    else:
+        binary_file = HuffmanFile(None, binary_mode, fileobj=filename,
+                                  canonical=canonical, block_size=block_size)
+    if 't' in mode:
+        return io.TextIOWrapper(binary_file, encoding, errors, newline)
+    return binary_file
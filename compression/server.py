@@ -0,0 +1,209 @@
+'''
+Huffman compression server
+
+Long running process listening on a unix domain socket that encodes and
+decodes data on behalf of compression.client, so that the interpreter start
+and imports are only paid for once.
+'''
+import argparse
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from compression import huffman
+from compression.client import (DEFAULT_SOCKET, ENCODE, ENCODE_CANONICAL,
+                                DECODE, OK, ERROR, read_message,
+                                write_message)
+
+
+class TableCache:
+    '''Bounded least recently used cache of decoders
+
+    Maps the raw header lines of a block to its decoder, used as the
+    tables argument of huffman.decode_into. Safe to share between threads.
+
+    Parameters
+    ---------
+    max_size: int, optional
+        Maximum number of decoders kept
+    '''
+    def __init__(self, max_size: int = 256):
+        self._max_size = max_size
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tables)
+
+    def get(self, table: bytes):
+        '''
+        Returns the decoder cached for table or None
+        '''
+        with self._lock:
+            decoder = self._tables.get(table)
+            if decoder is not None:
+                self._tables.move_to_end(table)
+            return decoder
+
+    def __setitem__(self, table: bytes, decoder) -> None:
+        with self._lock:
+            self._tables[table] = decoder
+            self._tables.move_to_end(table)
+            if len(self._tables) > self._max_size:
+                self._tables.popitem(last=False)
+
+
+class HuffmanRequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Handles all requests sent over one client connection
+
+    Each request is performed by the worker pool of the server, the
+    connection thread only waits for the result.
+    '''
+    def handle(self):
+        while (message := read_message(self.rfile)) is not None:
+            operation, payload = message
+            try:
+                status, response = OK, self.server.submit(operation,
+                                                          payload).result()
+            # Invalid headers exit through huffman.exit_with_message
+            except (Exception, SystemExit) as error:
+                status, response = ERROR, repr(error).encode()
+            write_message(self.wfile, status, response)
+
+
+class HuffmanServer(socketserver.ThreadingUnixStreamServer):
+    '''Unix domain socket server encoding and decoding requests
+
+    Every connection gets a thread reading its requests, which are handed
+    to a bounded pool of worker threads sharing a cache of decoders. The
+    number of open connections is thus not limited by the pool size.
+
+    Parameters
+    ---------
+    socket_path: str, optional
+        Path of the unix domain socket to listen on. A stale socket left at
+        the path is replaced, the socket is only accessible by its owner
+    workers: int, optional
+        Number of worker threads performing requests
+
+    Raises
+    -----
+    FileExistsError if socket_path is taken by something else than a stale
+    socket, e.g. a regular file or a running server
+    '''
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, workers: int = 4):
+        remove_stale_socket(socket_path)
+        super().__init__(socket_path, HuffmanRequestHandler)
+        self.tables = TableCache()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def server_bind(self):
+        # Only the owner may connect to the socket
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def submit(self, operation: bytes, payload: bytes):
+        '''
+        Queues the request to the worker pool, see dispatch
+
+        Returns
+        -------
+            A concurrent.futures.Future of the result
+        '''
+        return self._pool.submit(self.dispatch, operation, payload)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+    def dispatch(self, operation: bytes, payload: bytes) -> bytes:
+        '''
+        Performs the requested operation on payload and returns the result
+
+        Raises
+        -----
+        ValueError if the operation is unknown
+        '''
+        if operation == ENCODE:
+            return huffman.encode_data(payload)
+        if operation == ENCODE_CANONICAL:
+            return huffman.encode_data(payload, True)
+        if operation == DECODE:
+            size = huffman.stored_size(payload)
+            if size is None:
+                # Finding the size would take a full decode already
+                return huffman.decode_data(payload)
+            decoded_data = bytearray(size)
+            huffman.decode_into(payload, decoded_data, self.tables)
+            return decoded_data
+        raise ValueError(f'Unknown operation {operation!r}')
+
+
+def remove_stale_socket(socket_path: str) -> None:
+    '''
+    Removes the socket at socket_path if no server accepts connections on it
+
+    Raises
+    -----
+    FileExistsError if socket_path exists and isn't a stale socket
+    '''
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f'{socket_path} exists and is not a socket')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+            return
+    raise FileExistsError(f'A server is already listening on {socket_path}')
+
+
+def main() -> None:
+    '''
+    Main interactive function
+    '''
+    args = parse_args(sys.argv[1:])
+    with HuffmanServer(args.socket, args.workers) as server:
+        if args.verbose:
+            print(f'Listening on {args.socket}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def parse_args(args):
+    '''
+    Parses program argumens
+    '''
+    parser = argparse.ArgumentParser(
+            description='Huffman compression server.')
+    parser.add_argument('--socket', '-s', action='store',
+                        default=DEFAULT_SOCKET,
+                        help='Path to the unix domain socket to listen on')
+    parser.add_argument('--workers', '-w', action='store', type=int,
+                        default=4,
+                        help='Number of worker threads')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help='Verbose output')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,16 @@
+import io
 import os
+import re
 import sys
 import filecmp
+import socket
+import tempfile
+import threading
+import tracemalloc
 import unittest
-from compression import huffmantree, huffman
+from unittest import mock
+import compression
+from compression import huffmantree, huffman, huffmanfile, server, client
 
 
 def test_compress(file_name):
@@ -95,6 +103,366 @@ class HuffmanTest(unittest.TestCase):
         assert(filecmp.cmp(self.test_file_3, outfile_canon_decomp, shallow=False))
         
 
+    def test_append_data(self):
+        with open(self.test_file_2, 'rb') as fin:
+            data_read = fin.read()
+        with open(self.test_file_1, 'rb') as fin:
+            short_read = fin.read()
+        compressed_data = huffman.encode_data(data_read)
+        # Second block reuses the table, third one needs a new table
+        compressed_data += huffman.append_data(compressed_data, data_read)
+        compressed_data += huffman.append_data(compressed_data,
+                                               bytes(range(256)), True)
+        compressed_data += huffman.append_data(compressed_data, short_read)
+        assert len(huffman.split_blocks(compressed_data)) == 4
+        assert huffman.decode_data(compressed_data) ==\
+            data_read + data_read + bytes(range(256)) + short_read
+
+    def test_append_reuses_table(self):
+        with open(self.test_file_2, 'rb') as fin:
+            data_read = fin.read()
+        compressed_data = huffman.encode_data(data_read)
+        block = huffman.append_data(compressed_data, data_read)
+        assert block.startswith(b'HEND,')
+
+    def test_append_program_flow(self):
+        outfile = 'outa'
+        outfile_decomp = 'outda'
+        sys.argv = ['', '-i', self.test_file_1, '-o', outfile, '-e']
+        huffman.main()
+        sys.argv = ['', '-i', self.test_file_3, '-o', outfile, '-e', '-a']
+        huffman.main()
+        sys.argv = ['', '-o', outfile_decomp, '-i', outfile, '-d']
+        huffman.main()
+
+        with open(self.test_file_1, 'rb') as fin1,\
+                open(self.test_file_3, 'rb') as fin3,\
+                open(outfile_decomp, 'rb') as fout:
+            assert fout.read() == fin1.read() + fin3.read()
+
+    def test_encode_into_decode_into(self):
+        with open(self.test_file_3, 'rb') as fin:
+            data_read = fin.read()
+        compressed_data = huffman.encode_data(data_read)
+        buffer = bytearray(len(compressed_data) + 10)
+        size = huffman.encode_into(data_read, buffer)
+        assert size == len(compressed_data)
+        assert buffer[:size] == compressed_data
+
+        stream = io.BytesIO()
+        assert huffman.encode_into(data_read, stream, True) ==\
+            len(stream.getvalue())
+        compressed_canon = stream.getvalue()
+        compressed_canon += huffman.append_data(compressed_canon, data_read)
+
+        for compressed in (compressed_data, compressed_canon):
+            decoded = bytearray(huffman.decoded_size(compressed))
+            assert huffman.decode_into(compressed, memoryview(decoded)) ==\
+                len(decoded)
+            assert decoded == huffman.decode_data(compressed)
+
+    def test_decode_into_bounded_memory(self):
+        with open(self.test_file_3, 'rb') as fin:
+            data_read = fin.read() * 4
+        compressed_data = huffman.encode_data(data_read)
+        decoded = bytearray(len(data_read))
+        tracemalloc.start()
+        try:
+            huffman.decode_into(compressed_data, decoded)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert decoded == data_read
+        assert peak < len(data_read) // 4
+
+    def test_decode_into_bounded_memory_runs(self):
+        data = bytes(1 << 24) + b'abc' + b'\xff' * (1 << 20)
+        compressed_data = huffman.encode_data(data)
+        decoded = bytearray(len(data))
+        tracemalloc.start()
+        try:
+            huffman.decode_into(compressed_data, decoded)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert decoded == data
+        # A long run is expanded a chunk at a time
+        assert peak < huffman.DECODE_CHUNK_SIZE * 8
+
+    def test_decode_chunks_runs(self):
+        data = (bytes(5000) + bytes(range(100)) + b'\xff' * 300) * 10
+        compressed_data = huffman.encode_data(data)
+        for chunk_size in (1, 7, 4096):
+            for max_output in (None, 1, 5000, 5123, len(data) - 1):
+                chunks = list(huffman.decode_blocks(compressed_data,
+                                                    max_output=max_output,
+                                                    chunk_size=chunk_size))
+                assert all(len(chunk) <= chunk_size for chunk in chunks)
+                assert b''.join(chunks) == data[:max_output]
+
+    def test_decode_into_small_buffer(self):
+        compressed_data = huffman.encode_data(b'this is a test string')
+        with self.assertRaises(ValueError):
+            huffman.decode_into(compressed_data, bytearray(5))
+        with self.assertRaises(ValueError):
+            huffman.encode_into(b'this is a test string', bytearray(5))
+
+    def test_run_length(self):
+        data = (bytes(3000) + bytes(range(200)) + b'\xff' * 1000) * 20
+        for canonical in (False, True):
+            compressed_data = huffman.encode_data(data, canonical)
+            assert huffman.has_runs(huffman.parse_header(
+                huffman.deconstruct_encoded_data(compressed_data)[0]))
+            assert huffman.decode_data(compressed_data) == data
+            decoded = bytearray(len(data))
+            huffman.decode_into(compressed_data, decoded)
+            assert decoded == data
+
+    def test_run_length_long_run(self):
+        data = bytes(1 << 20)
+        compressed_data = huffman.encode_data(data)
+        assert len(compressed_data) < 256
+        assert huffman.decode_data(compressed_data) == data
+
+    def test_run_length_skipped_for_text(self):
+        with open(self.test_file_3, 'rb') as fin:
+            data_read = fin.read()
+        assert huffman.run_length_encode(data_read) is data_read
+        # Runs of indentation don't save enough symbols to be worth it
+        lines = [b' ' * (20 + line % 11) + b'x = %d\n' % line * 4
+                 for line in range(1000)]
+        data = b''.join(lines)
+        assert huffman.run_length_encode(data) is data
+
+    def test_decode_head(self):
+        with open(self.test_file_3, 'rb') as fin:
+            data_read = fin.read()
+        compressed_data = huffman.encode_data(data_read)
+        compressed_data += huffman.append_data(compressed_data, b'abc' * 10)
+        data_read += b'abc' * 10
+        for max_output in (0, 1, 4096, len(data_read) - 1, len(data_read),
+                           len(data_read) + 1):
+            assert huffman.decode_data(compressed_data, max_output) ==\
+                data_read[:max_output]
+
+        # Headers without stored size
+        symbol_tree = huffmantree.HuffmanTree(
+            data=data_read).get_symbol_tree_by_val()
+        compressed_data = huffman.construct_header(symbol_tree) +\
+            huffman.encode(symbol_tree, data_read)
+        assert huffman.decode_data(compressed_data, 100) == data_read[:100]
+
+    def test_decode_head_many_blocks(self):
+        with open(self.test_file_3, 'rb') as fin:
+            data_read = fin.read()
+        stream = io.BytesIO()
+        with huffmanfile.HuffmanFile(fileobj=stream, mode='wb',
+                                     block_size=4096) as fout:
+            fout.write(data_read)
+        compressed_data = stream.getvalue()
+        assert len(huffman.split_blocks(compressed_data)) > 100
+        assert huffman.decode_data(compressed_data) == data_read
+        # Blocks are found going forward, so the end of the data is never
+        # looked at when only the first blocks are needed
+        compressed_data += b'\ngarbage'
+        for max_output in (100, 4096, 10000):
+            assert huffman.decode_data(compressed_data, max_output) ==\
+                data_read[:max_output]
+
+    def test_decode_blocks_without_trailer_walk(self):
+        with open(self.test_file_3, 'rb') as fin:
+            data_read = fin.read()
+        stream = io.BytesIO()
+        with huffmanfile.HuffmanFile(fileobj=stream, mode='wb',
+                                     block_size=4096) as fout:
+            fout.write(data_read)
+        compressed_data = stream.getvalue()
+        # The encoded length in the headers gives the end of every block
+        with mock.patch.object(huffman, 'split_blocks',
+                               side_effect=AssertionError):
+            assert huffman.decode_data(compressed_data) == data_read
+        # Blocks only storing their size are found from the trailers
+        header_end = huffman.header_end
+        stream = io.BytesIO()
+        with mock.patch.object(huffman, 'header_end',
+                               lambda size=None, *lengths: header_end(size)):
+            with huffmanfile.HuffmanFile(fileobj=stream, mode='wb',
+                                         block_size=4096) as fout:
+                fout.write(data_read)
+        compressed_data = stream.getvalue()
+        assert re.search(rb'HEND,[0-9a-f]+,', compressed_data) is None
+        assert huffman.decode_data(compressed_data) == data_read
+        assert huffman.decode_data(compressed_data, 5000) == data_read[:5000]
+
+    def test_decode_head_runs(self):
+        data = (bytes(5000) + b'abc') * 3
+        compressed_data = huffman.encode_data(data)
+        for max_output in range(0, len(data) + 3, 7):
+            assert huffman.decode_data(compressed_data, max_output) ==\
+                data[:max_output]
+
+    def test_head_program_flow(self):
+        outfile = 'outh'
+        outfile_decomp = 'outdh'
+        sys.argv = ['', '-i', self.test_file_3, '-o', outfile, '-e']
+        huffman.main()
+        sys.argv = ['', '-o', outfile_decomp, '-i', outfile, '-d', '-n',
+                    '1000']
+        huffman.main()
+
+        with open(self.test_file_3, 'rb') as fin,\
+                open(outfile_decomp, 'rb') as fout:
+            assert fout.read() == fin.read(1000)
+
+
+class HuffmanFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'file.huf')
+        with open(HuffmanTest.test_file_3, 'rb') as fin:
+            self.data_read = fin.read()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write_read(self):
+        with compression.open(self.path, 'wb', block_size=100000) as fout:
+            for index in range(0, len(self.data_read), 1000):
+                fout.write(self.data_read[index:index + 1000])
+        with open(self.path, 'rb') as fin:
+            compressed_data = fin.read()
+        assert len(huffman.split_blocks(compressed_data)) > 1
+        assert huffman.decode_data(compressed_data) == self.data_read
+
+        with compression.open(self.path) as fin:
+            line_end = self.data_read.index(b'\n') + 1
+            assert fin.read(10) == self.data_read[:10]
+            assert fin.readline() == self.data_read[10:line_end]
+            assert fin.tell() == line_end
+            assert fin.read() == self.data_read[line_end:]
+        with compression.open(self.path) as fin:
+            assert list(fin) == self.data_read.splitlines(keepends=True)
+
+    def test_read_encoded_data(self):
+        huffman.encode_file(HuffmanTest.test_file_3, self.path)
+        with compression.open(self.path, 'rt', encoding='utf-8') as fin:
+            assert fin.read() == self.data_read.decode('utf-8')
+
+    def test_append(self):
+        huffman.encode_file(HuffmanTest.test_file_3, self.path)
+        with compression.open(self.path, 'ab') as fout:
+            fout.write(b'appended line\n')
+        with compression.open(self.path) as fin:
+            assert fin.read() == self.data_read + b'appended line\n'
+
+    def test_fileobj(self):
+        stream = io.BytesIO()
+        with huffmanfile.HuffmanFile(fileobj=stream, mode='wb') as fout:
+            fout.write(self.data_read)
+        with open(self.path, 'wb') as fout:
+            fout.write(stream.getvalue())
+        with open(self.path, 'rb') as fileobj:
+            with huffmanfile.HuffmanFile(fileobj=fileobj) as fin:
+                assert fin.read() == self.data_read
+            with self.assertRaises(io.UnsupportedOperation):
+                huffmanfile.HuffmanFile(fileobj=fileobj).write(b'abc')
+        # In-memory streams would have to be read whole
+        with self.assertRaises(io.UnsupportedOperation):
+            huffmanfile.HuffmanFile(fileobj=stream)
+
+    def test_read_pipe(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(write_fd, 'wb') as pipe_out:
+            pipe_out.write(huffman.encode_data(b'data through a pipe'))
+        with os.fdopen(read_fd, 'rb') as pipe_in:
+            with self.assertRaises(io.UnsupportedOperation):
+                huffmanfile.HuffmanFile(fileobj=pipe_in)
+            # Nothing was read from the pipe
+            assert huffman.decode_data(pipe_in.read()) ==\
+                b'data through a pipe'
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmpdir.name, 'huffman.sock')
+        self.server = server.HuffmanServer(self.socket_path, workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_encode_decode(self):
+        with open(HuffmanTest.test_file_3, 'rb') as fin:
+            data_read = fin.read()
+        with client.HuffmanClient(self.socket_path) as huffman_client:
+            for canonical in (False, True):
+                compressed_data = huffman_client.encode(data_read, canonical)
+                assert compressed_data == huffman.encode_data(data_read,
+                                                              canonical)
+                assert huffman_client.decode(compressed_data) == data_read
+                # Decoding again is served from the table cache
+                assert huffman_client.decode(compressed_data) == data_read
+        assert len(self.server.tables) == 2
+
+    def test_error_response(self):
+        with client.HuffmanClient(self.socket_path) as huffman_client:
+            with self.assertRaises(client.HuffmanServerException):
+                huffman_client.encode(b'')
+            # The connection is still usable after an error
+            assert huffman_client.decode(huffman_client.encode(b'abc')) ==\
+                b'abc'
+
+    def test_decode_without_stored_size(self):
+        compressed_data = huffman.encode_data(b'no size stored')
+        compressed_data = re.sub(rb'HEND,.*\n', b'HEND\n', compressed_data)
+        # The data is decoded once instead of first finding its size
+        with mock.patch.object(huffman, 'decode_into',
+                               side_effect=AssertionError):
+            assert self.server.dispatch(client.DECODE, compressed_data) ==\
+                b'no size stored'
+
+    def test_more_clients_than_workers(self):
+        clients = [client.HuffmanClient(self.socket_path, timeout=5)
+                   for _ in range(5)]
+        try:
+            for index, huffman_client in enumerate(clients):
+                data = b'client %d data' % index
+                assert huffman_client.decode(huffman_client.encode(data)) ==\
+                    data
+        finally:
+            for huffman_client in clients:
+                huffman_client.close()
+
+    def test_socket_permissions(self):
+        assert os.stat(self.socket_path).st_mode & 0o777 == 0o600
+
+    def test_socket_path_in_use(self):
+        # A running server isn't taken over
+        with self.assertRaises(FileExistsError):
+            server.HuffmanServer(self.socket_path)
+        # Regular files are left alone
+        file_path = os.path.join(self.tmpdir.name, 'file')
+        with open(file_path, 'wb') as fout:
+            fout.write(b'data')
+        with self.assertRaises(FileExistsError):
+            server.HuffmanServer(file_path)
+        with open(file_path, 'rb') as fin:
+            assert fin.read() == b'data'
+
+    def test_stale_socket_replaced(self):
+        stale_path = os.path.join(self.tmpdir.name, 'stale.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(stale_path)
+        huffman_server = server.HuffmanServer(stale_path)
+        huffman_server.server_close()
+
 
 if __name__ == '__main__':
     unittest.main()